@@ -1,17 +1,21 @@
 from modules.pdf_loader import extract_questions_and_answers
-from modules.vector_store import create_faiss_index, search_faiss, generate_response
+from modules.vector_store import search_faiss, generate_response
 from modules.problem_solver import solve_text_problem, solve_image_problem, solve_pdf_problem, generate_mcq
 from modules.logger import log_interaction
 from modules.feedback import interactive_feedback
-import modules.vector_store as vector_store
+import modules.index_snapshot as index_snapshot
+import modules.shard_search as shard_search
+import modules.question_bank as question_bank
 from modules.text_processing import chunk_text
 
 import os
 import time
+import atexit
 import sys
 import io
 import json
 import faiss
+from functools import partial
 import sys
 import time
 
@@ -37,6 +41,10 @@ with open("output/questions.json", "w", encoding="utf-8") as fq:
     json.dump(questions, fq, ensure_ascii=False, indent=2)
 with open("output/answers.json", "w", encoding="utf-8") as fa:
     json.dump(answers, fa, ensure_ascii=False, indent=2)
+
+# ✅ 기출문제 그대로 입력된 경우를 위한 문제 은행 (정규화 해시 + MinHash)
+question_bank_entries = question_bank.build_question_bank(questions, answers)
+print(f"✅ 문제 은행 생성 완료! (정답이 있는 문제: {len(question_bank_entries)}개)")
     
 print_progress("🔍 [2] 청크 분할 중")
 question_chunks, question_answer_pairs, general_chunks = chunk_text(
@@ -45,21 +53,37 @@ question_chunks, question_answer_pairs, general_chunks = chunk_text(
 
 print(f"✅ [2] 완료! (문제 청크: {len(question_chunks)}개, 일반 텍스트 청크: {len(general_chunks)}개)")
 
-# ✅ 인덱스가 이미 존재하면 재사용, 없으면 생성
-if not os.path.exists("embeddings/faiss_index") or not os.path.exists("embeddings/metadata.json"):
+# ✅ 인덱스 준비
+#   - --reindex 이거나 기존 인덱스 파일이 없으면: 방금 만든 청크로 새 스냅샷 게시
+#   - 스냅샷이 아직 없으면: 기존 인덱스 파일을 첫 스냅샷으로 변환
+#   - 실행 중인 다른 프로세스에 반영하려면: python -m modules.index_snapshot publish
+if "--reindex" in sys.argv or not os.path.exists("embeddings/faiss_index") or not os.path.exists("embeddings/metadata.json"):
     print_progress("🔍 [3] FAISS 및 BM25 인덱스 생성 중")
-    vector_store.FAISS_INDEX, vector_store.BM25_CORPUS = create_faiss_index(
-        question_answer_pairs, general_chunks
-    )
-    faiss.write_index(vector_store.FAISS_INDEX, "embeddings/faiss_index")
-    with open("embeddings/metadata.json", "w", encoding="utf-8") as f:
-        json.dump(vector_store.BM25_CORPUS, f, ensure_ascii=False, indent=2)
-    print("✅ [3] 완료!")
-else:
-    print("✅ [3] 인덱스가 이미 존재합니다. 재사용합니다.")
-    vector_store.FAISS_INDEX = faiss.read_index("embeddings/faiss_index")
+    index_snapshot.rebuild_and_publish(question_answer_pairs, general_chunks)
+elif index_snapshot.read_current_version() is None:
+    print("✅ [3] 인덱스가 이미 존재합니다. 스냅샷으로 변환합니다.")
+    faiss_index = faiss.read_index("embeddings/faiss_index")
     with open("embeddings/metadata.json", "r", encoding="utf-8") as f:
-        vector_store.BM25_CORPUS = json.load(f)
+        bm25_corpus = json.load(f)
+    index_snapshot.publish_snapshot(faiss_index, bm25_corpus)
+else:
+    print("✅ [3] 스냅샷이 이미 존재합니다. 재사용합니다.")
+
+# ✅ RAG_NUM_SHARDS가 2 이상이면 스냅샷을 샤드로 나눠 워커 프로세스에서 검색
+NUM_SHARDS = int(os.getenv("RAG_NUM_SHARDS", "0"))
+SHARD_DEADLINE = float(os.getenv("RAG_SHARD_DEADLINE", "1.0"))
+prepare_snapshot = (
+    partial(shard_search.attach_shard_pool, num_shards=NUM_SHARDS, deadline=SHARD_DEADLINE)
+    if NUM_SHARDS > 1 else None
+)
+
+index_snapshot.reload_if_changed(prepare_snapshot)
+print(f"📦 활성 인덱스 스냅샷: {index_snapshot.get_active_version()}")
+
+# ✅ 다른 프로세스가 새 스냅샷을 게시하면 재시작 없이 교체
+index_snapshot.start_watcher(interval=5.0, prepare=prepare_snapshot)
+# ✅ 종료 시 (exit, Ctrl-C 포함) watcher 정지 및 활성 스냅샷 해제
+atexit.register(index_snapshot.shutdown)
 
 print("✅ [3] 완료!")
 
@@ -73,6 +97,18 @@ def main():
         query = input("입력: ")
 
         if query.lower() == "exit":
+            stats = question_bank.get_stats()
+            print(f"📊 문제 은행 적중률: {stats['hit_rate']:.1%} "
+                  f"(정확 {stats['exact_hits']}회, 근사 {stats['near_hits']}회, 근사 후보 기각 {stats['near_rejected']}회)")
+            if stats["saved_measured"]:
+                print(f"⏱️ 절약 시간: {stats['saved_seconds']:.1f}초 (측정된 전체 풀이 평균 기준)")
+            else:
+                print("⏱️ 절약 시간: 전체 풀이 기록이 없어 측정 전입니다.")
+            with index_snapshot.acquire_snapshot() as snapshot:
+                if snapshot is not None and snapshot.shard_pool is not None:
+                    shard_stats = snapshot.shard_pool.stats()
+                    print(f"📊 샤드 상태: 시간 초과 {shard_stats['timeouts']}회, 재시작 {shard_stats['restarts']}회, "
+                          f"중단된 샤드 {shard_stats['dead_shards']}")
             print("🔚 프로그램을 종료합니다.")
             break
 
@@ -0,0 +1,294 @@
+import os
+import sys
+import json
+import time
+import uuid
+import pickle
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import faiss
+from rank_bm25 import BM25Okapi
+
+# 스냅샷 저장 경로
+SNAPSHOT_ROOT = "embeddings/snapshots"
+CURRENT_POINTER_PATH = "embeddings/CURRENT"
+# 스냅샷에서 파생된 데이터(샤드 등) 저장 경로 → 스냅샷 디렉터리는 게시 후 변경하지 않음
+DERIVED_ROOT = "embeddings/derived"
+
+FAISS_FILE = "faiss_index"
+METADATA_FILE = "metadata.json"
+BM25_FILE = "bm25.pkl"
+MANIFEST_FILE = "manifest.json"
+
+# 게시 후 디스크에 남겨둘 스냅샷 개수 (현재 버전 포함)
+KEEP_SNAPSHOTS = 3
+# 다른 프로세스가 아직 직전 버전을 서비스 중일 수 있으므로 최소 2개(현재 + 직전)는 항상 보존
+MIN_KEEP_SNAPSHOTS = 2
+
+# ✅ 현재 서비스 중인 스냅샷 (포인터 교체는 _active_lock 안에서만)
+_active_snapshot = None
+_active_lock = threading.Lock()
+
+_watcher_thread = None
+_watcher_stop = threading.Event()
+
+
+class IndexSnapshot:
+    """한 버전의 FAISS 인덱스 + BM25 상태 + 메타데이터 묶음 (불변)
+
+    refcount는 활성 포인터가 1개, 진행 중인 검색마다 1개씩 보유합니다.
+    0이 되면 인덱스 메모리를 해제합니다.
+    """
+
+    def __init__(self, version, faiss_index, bm25_corpus, bm25_index=None, manifest=None, path=None):
+        self.version = version
+        self.faiss_index = faiss_index
+        self.bm25_corpus = bm25_corpus
+        self.bm25_index = bm25_index if bm25_index is not None else BM25Okapi([doc.split() for doc in bm25_corpus])
+        self.manifest = manifest or {}
+        self.path = path
+        self.refcount = 1
+        self.shard_pool = None  # 샤드 모드에서 검색을 담당하는 워커 묶음
+        self.on_close = []  # 메모리 해제 시 함께 정리할 리소스 (콜백)
+
+    def close(self):
+        for callback in self.on_close:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ 스냅샷 {self.version} 리소스 정리 중 오류: {e}")
+        self.on_close = []
+        self.faiss_index = None
+        self.bm25_corpus = []
+        self.bm25_index = None
+
+
+def _release(snapshot):
+    with _active_lock:
+        snapshot.refcount -= 1
+        should_close = snapshot.refcount == 0
+    if should_close:
+        snapshot.close()
+        print(f"🧹 이전 스냅샷 해제 완료: {snapshot.version}")
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# ✅ 새 스냅샷을 디렉터리에 기록하고 CURRENT 포인터를 원자적으로 교체
+def publish_snapshot(faiss_index, bm25_corpus, bm25_index=None, extra_manifest=None):
+    # 버전 이름은 생성 시각 순으로 정렬됨 (prune_snapshots가 이름 순서로 정리)
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f") + "-" + uuid.uuid4().hex[:6]
+    os.makedirs(SNAPSHOT_ROOT, exist_ok=True)
+
+    # 임시 디렉터리에 모두 쓴 뒤 rename → 반쯤 쓰인 스냅샷은 절대 노출되지 않음
+    tmp_dir = os.path.join(SNAPSHOT_ROOT, f".tmp-{version}")
+    final_dir = os.path.join(SNAPSHOT_ROOT, version)
+    os.makedirs(tmp_dir)
+
+    if bm25_index is None:
+        bm25_index = BM25Okapi([doc.split() for doc in bm25_corpus])
+
+    faiss.write_index(faiss_index, os.path.join(tmp_dir, FAISS_FILE))
+    with open(os.path.join(tmp_dir, METADATA_FILE), "w", encoding="utf-8") as f:
+        json.dump(bm25_corpus, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(tmp_dir, BM25_FILE), "wb") as f:
+        pickle.dump(bm25_index, f)
+
+    manifest = {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "num_vectors": faiss_index.ntotal,
+        "dimension": faiss_index.d,
+        "num_documents": len(bm25_corpus),
+        "files": {
+            name: _file_sha256(os.path.join(tmp_dir, name))
+            for name in (FAISS_FILE, METADATA_FILE, BM25_FILE)
+        },
+    }
+    if extra_manifest:
+        manifest.update(extra_manifest)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    os.rename(tmp_dir, final_dir)
+
+    pointer_tmp = f"{CURRENT_POINTER_PATH}.tmp-{version}"
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, CURRENT_POINTER_PATH)
+
+    print(f"✅ 스냅샷 게시 완료: {version}")
+    return version
+
+
+def read_current_version():
+    if not os.path.exists(CURRENT_POINTER_PATH):
+        return None
+    with open(CURRENT_POINTER_PATH, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+# ✅ 디스크의 스냅샷 한 버전을 메모리로 로드
+def load_snapshot(version):
+    path = os.path.join(SNAPSHOT_ROOT, version)
+    with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    faiss_index = faiss.read_index(os.path.join(path, FAISS_FILE))
+    with open(os.path.join(path, METADATA_FILE), "r", encoding="utf-8") as f:
+        bm25_corpus = json.load(f)
+    with open(os.path.join(path, BM25_FILE), "rb") as f:
+        bm25_index = pickle.load(f)
+
+    if faiss_index.ntotal != manifest["num_vectors"] or len(bm25_corpus) != manifest["num_documents"]:
+        raise ValueError(f"❌ 스냅샷 {version}의 manifest와 데이터가 일치하지 않습니다.")
+
+    return IndexSnapshot(version, faiss_index, bm25_corpus, bm25_index, manifest, path)
+
+
+# ✅ 활성 스냅샷 교체 (진행 중인 검색은 이전 스냅샷으로 끝까지 실행)
+def activate_snapshot(snapshot):
+    global _active_snapshot
+    with _active_lock:
+        previous = _active_snapshot
+        _active_snapshot = snapshot
+    if previous is not None:
+        _release(previous)
+    return previous
+
+
+def get_active_version():
+    with _active_lock:
+        return _active_snapshot.version if _active_snapshot is not None else None
+
+
+# ✅ 검색 시작 시 스냅샷을 잡고, 끝나면 놓는다
+@contextmanager
+def acquire_snapshot():
+    with _active_lock:
+        snapshot = _active_snapshot
+        if snapshot is not None:
+            snapshot.refcount += 1
+    try:
+        yield snapshot
+    finally:
+        if snapshot is not None:
+            _release(snapshot)
+
+
+# ✅ CURRENT 포인터가 바뀌었으면 새 스냅샷을 로드해서 교체
+def reload_if_changed(prepare=None):
+    version = read_current_version()
+    if version is None or version == get_active_version():
+        return False
+
+    # 로드는 락 밖에서 수행 → 검색 경로는 포인터 교체 순간에만 잠깐 대기
+    snapshot = load_snapshot(version)
+    if prepare is not None:
+        prepare(snapshot)
+    activate_snapshot(snapshot)
+    print(f"🔄 인덱스 스냅샷 교체: {version}")
+    return True
+
+
+def start_watcher(interval=5.0, prepare=None):
+    """백그라운드 스레드에서 CURRENT 포인터를 주기적으로 확인해 핫 리로드"""
+    global _watcher_thread
+    if _watcher_thread is not None and _watcher_thread.is_alive():
+        return _watcher_thread
+
+    def _watch():
+        while not _watcher_stop.wait(interval):
+            try:
+                reload_if_changed(prepare)
+            except Exception as e:
+                print(f"⚠️ 스냅샷 리로드 실패 (기존 스냅샷 유지): {e}")
+
+    _watcher_stop.clear()
+    _watcher_thread = threading.Thread(target=_watch, name="snapshot-watcher", daemon=True)
+    _watcher_thread.start()
+    return _watcher_thread
+
+
+def stop_watcher():
+    _watcher_stop.set()
+
+
+def derived_path(version):
+    """버전별 파생 데이터 디렉터리 (manifest 대상이 아니며, 스냅샷과 함께 정리됨)"""
+    return os.path.join(DERIVED_ROOT, version)
+
+
+# ✅ 프로세스 종료 시 watcher를 멈추고 활성 스냅샷(및 딸린 리소스)을 해제
+def shutdown():
+    stop_watcher()
+    activate_snapshot(None)
+
+
+# ✅ 오래된 스냅샷 디렉터리 정리 (최신 keep개, 현재 버전, 이 프로세스가 사용 중인 버전은 보존)
+def prune_snapshots(keep=KEEP_SNAPSHOTS):
+    if not os.path.exists(SNAPSHOT_ROOT):
+        return []
+    keep = max(keep, MIN_KEEP_SNAPSHOTS)
+    protected = {read_current_version(), get_active_version()}
+    # 버전 이름이 생성 시각으로 시작하므로 이름 순 = 생성 순
+    versions = sorted(
+        v for v in os.listdir(SNAPSHOT_ROOT)
+        if not v.startswith(".") and os.path.isdir(os.path.join(SNAPSHOT_ROOT, v))
+    )
+    removed = []
+    for version in versions[:-keep]:
+        if version in protected:
+            continue
+        shutil.rmtree(os.path.join(SNAPSHOT_ROOT, version), ignore_errors=True)
+        shutil.rmtree(derived_path(version), ignore_errors=True)
+        removed.append(version)
+    return removed
+
+
+# ✅ 청크로부터 인덱스를 새로 만들어 게시 (실행 중인 프로세스는 watcher가 교체)
+def rebuild_and_publish(question_answer_pairs, general_chunks, keep=KEEP_SNAPSHOTS):
+    # vector_store가 이 모듈을 import 하므로 함수 안에서 import
+    from modules import vector_store
+
+    faiss_index, bm25_corpus = vector_store.create_faiss_index(question_answer_pairs, general_chunks)
+    # 기존 embeddings/faiss_index, metadata.json도 최신 상태로 유지
+    with open(vector_store.METADATA_PATH, "w", encoding="utf-8") as f:
+        json.dump(bm25_corpus, f, ensure_ascii=False, indent=2)
+
+    version = publish_snapshot(faiss_index, bm25_corpus, vector_store.bm25_index)
+    removed = prune_snapshots(keep)
+    if removed:
+        print(f"🧹 오래된 스냅샷 {len(removed)}개 삭제")
+    return version
+
+
+# ✅ data/ 폴더의 PDF로부터 새 스냅샷 게시 (python -m modules.index_snapshot publish)
+def publish_from_pdfs():
+    from modules.pdf_loader import extract_questions_and_answers
+    from modules.text_processing import chunk_text
+
+    questions, answers, general_texts = extract_questions_and_answers()
+    _, question_answer_pairs, general_chunks = chunk_text(
+        questions, answers, general_texts, max_length=300, overlap=50
+    )
+    return rebuild_and_publish(question_answer_pairs, general_chunks)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["publish"]:
+        print("사용법: python -m modules.index_snapshot publish")
+        sys.exit(1)
+    publish_from_pdfs()
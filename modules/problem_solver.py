@@ -1,5 +1,6 @@
 import os
 import re
+import time
 import pytesseract
 from openai import OpenAI
 from dotenv import load_dotenv
@@ -16,8 +17,27 @@ client = OpenAI(api_key=OPENAI_API_KEY)
 
 # ✅ 텍스트 입력 문제 풀이
 from modules.vector_store import search_faiss  # 추가 필요
+from modules import question_bank
 
 def solve_text_problem(problem_text):
+    start_time = time.time()
+
+    # ✅ 기출문제와 일치하면 임베딩/FAISS 검색 없이 저장된 정답 사용
+    match = question_bank.lookup(problem_text)
+    if match is not None:
+        solution = solve_from_question_bank(problem_text, match)
+        if solution is not None:
+            question_bank.record_fast_path(time.time() - start_time, match)
+            return solution
+        # 다른 문제로 판정됨 → 확인 호출 시간이 섞이지 않도록 RAG 풀이 시간은 따로 측정
+        question_bank.record_near_rejected()
+        start_time = time.time()
+
+    solution = solve_with_rag(problem_text)
+    question_bank.record_full_solve(time.time() - start_time)
+    return solution
+
+def solve_with_rag(problem_text):
     search_results = search_faiss(problem_text, top_k=3)
     context = "\n".join([r["text"] for r in search_results])
 
@@ -39,6 +59,40 @@ def solve_text_problem(problem_text):
     )
     return response.choices[0].message.content
 
+# ✅ 문제 은행 적중 시 풀이 (정확 일치: 즉시 반환 / 근사 일치: 짧은 해설 요청)
+def solve_from_question_bank(problem_text, match):
+    header = f"📚 기출문제와 일치하는 문제입니다.\n\n📖 문제: {match['question']}\n✅ {match['answer']}"
+    if match["match"] == "exact":
+        return header
+
+    # OCR 오류로 일부가 다를 수 있으므로 저장된 정답을 근거로 짧게 해설만 요청
+    prompt = f"""다음은 입력된 문제와 가장 유사한 기출문제와 그 정답입니다.
+
+입력 문제: {problem_text}
+
+기출문제: {match['question']}
+{match['answer']}
+
+입력 문제가 기출문제와 같은 문제인지 판정하세요.
+- 첫 줄에는 반드시 SAME 또는 DIFFERENT 한 단어만 쓰세요.
+- 묻는 내용이 반대이거나(예: "해당하는 것" / "해당하지 않는 것") 조건이 다르면 DIFFERENT 입니다.
+- SAME인 경우 둘째 줄부터 정답과 핵심 해설을 3문장 이내로 작성하세요."""
+
+    response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "당신은 스포츠경영관리사 시험 문제를 푸는 전문가입니다."},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=300
+    )
+    lines = (response.choices[0].message.content or "").strip().splitlines()
+    # 첫 줄이 정확히 SAME일 때만 저장된 정답 사용, 그 외 응답은 모두 전체 RAG 풀이로 진행
+    if not lines or lines[0].strip() != "SAME":
+        return None
+    explanation = "\n".join(lines[1:]).strip()
+    return f"{header}\n\n💡 해설: {explanation}" if explanation else header
+
 # ✅ 이미지 문제 풀이 (OCR)
 def solve_image_problem(image_path):
     try:
@@ -0,0 +1,211 @@
+import re
+import zlib
+import random
+import hashlib
+import threading
+
+import numpy as np
+
+from modules.vector_store import normalize_text
+
+# MinHash 설정 (64개 해시 = 16밴드 x 4행)
+SHINGLE_SIZE = 2  # 한글은 글자 밀도가 높아 2-gram으로도 충분히 구별됨
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+NEAR_MATCH_THRESHOLD = 0.75  # 추정 Jaccard 유사도가 이 값 이상이면 같은 문제 후보로 간주
+
+# 정규화 후 이 길이보다 짧은 문제/입력은 문제 은행에 넣지도, 조회하지도 않음
+# (보기 조각이나 "성장 벡터" 같은 단어 입력이 엉뚱한 문제에 적중하는 것 방지)
+MIN_QUESTION_LENGTH = 12
+
+# pdf_loader가 새 문제로 잘라낸 "1) ...", "(2) ..." 형태의 보기 줄
+_OPTION_LINE = re.compile(r"^\s*\(?([1-5])\)\s*")
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = random.Random(42)  # 프로세스가 달라도 같은 시그니처가 나오도록 고정 시드
+_PERM_A = np.array([_rng.randrange(1, _MERSENNE_PRIME) for _ in range(NUM_PERM)], dtype=np.uint64)
+_PERM_B = np.array([_rng.randrange(0, _MERSENNE_PRIME) for _ in range(NUM_PERM)], dtype=np.uint64)
+
+# ✅ 글로벌 변수로 문제 은행 캐싱
+QUESTION_BANK = []      # [{"question": ..., "answer": ...}]
+EXACT_INDEX = {}        # 정규화 텍스트 해시 → QUESTION_BANK 번호
+LSH_BUCKETS = {}        # (밴드 번호, 밴드 값) → QUESTION_BANK 번호 리스트
+SIGNATURES = []
+NUMBERS = []            # 문제별 숫자 목록 (근사 일치 시 숫자가 다르면 제외)
+
+# ✅ 적중률 / 절약 시간 카운터
+# near_rejected: MinHash로 찾았지만 해설 단계에서 다른 문제로 판정된 경우 (적중으로 세지 않음)
+STATS = {"lookups": 0, "exact_hits": 0, "near_hits": 0, "near_rejected": 0, "misses": 0, "saved_seconds": 0.0}
+_stats_lock = threading.Lock()
+_full_solve_avg = None  # 전체 RAG 풀이 평균 소요 시간 (지수 이동 평균, 측정 전에는 None)
+_unmeasured_fast_paths = []  # 전체 풀이 측정 전의 문제 은행 응답 시간 → 첫 측정 시 절약 시간으로 반영
+
+
+# ✅ 보기 번호, 문제 번호 등을 제거한 비교용 텍스트
+def normalize_question(text):
+    text = re.sub(r"^\s*(문제\s*)?\d+\s*[\.\)]\s*", "", text)   # 앞쪽 문제 번호 (예: "문제 3.", "12)")
+    text = re.sub(r"[①②③④⑤⑥⑦⑧⑨⑩]", " ", text)              # 원문자 보기 번호
+    text = re.sub(r"(?<!\d)\(?\d{1,2}\)", " ", text)           # "1)", "(2)" 형태 보기 번호
+    text = re.sub(r"(?<![가-힣])[ㄱㄴㄷㄹㅁㅂ]\s*[\.\)]", " ", text)   # "ㄱ.", "ㄴ)" 형태 보기
+    text = re.sub(r"[^\w\s]", "", text)                        # 문장부호 제거
+    return normalize_text(text.lower())
+
+
+def _exact_key(normalized):
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _minhash_signature(normalized):
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64)
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+
+def _band_keys(signature):
+    return [(band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tolist())) for band in range(LSH_BANDS)]
+
+
+def _index_entries(entries):
+    global QUESTION_BANK, EXACT_INDEX, LSH_BUCKETS, SIGNATURES, NUMBERS
+
+    exact_index = {}
+    buckets = {}
+    signatures = []
+    numbers = []
+    for entry_id, entry in enumerate(entries):
+        normalized = normalize_question(entry["question"])
+        exact_index.setdefault(_exact_key(normalized), entry_id)
+        signature = _minhash_signature(normalized)
+        signatures.append(signature)
+        numbers.append(_numbers(normalized))
+        for key in _band_keys(signature):
+            buckets.setdefault(key, []).append(entry_id)
+
+    QUESTION_BANK, EXACT_INDEX, LSH_BUCKETS, SIGNATURES, NUMBERS = entries, exact_index, buckets, signatures, numbers
+
+
+# ✅ pdf_loader가 따로 잘라낸 보기 줄을 문제 본문에 다시 합침
+def _merge_option_lines(questions, answers):
+    """ "1) ...", "2) ..." 처럼 1번부터 차례로 이어지는 보기 조각을 직전 문제에 붙이고,
+    마지막 조각에 붙어 있던 정답을 합친 문제의 정답으로 사용"""
+    merged = []
+    next_option = None  # 현재 문제에 이어 붙일 수 있는 다음 보기 번호
+    for i, question in enumerate(questions):
+        answer = answers[i] if i < len(answers) else ""
+        option = _OPTION_LINE.match(question)
+        if merged and next_option is not None and option and int(option.group(1)) == next_option:
+            merged[-1]["question"] += " " + question
+            merged[-1]["answer"] = answer
+            next_option += 1
+        else:
+            merged.append({"question": question, "answer": answer})
+            next_option = 1
+        # 정답이 나오면 해당 문제는 끝
+        if answer:
+            next_option = None
+    return merged
+
+
+# ✅ 수집 단계에서 추출한 문제-정답으로 문제 은행 생성
+def build_question_bank(questions, answers):
+    entries = []
+    seen = set()
+    for entry in _merge_option_lines(questions, answers):
+        normalized = normalize_question(entry["question"])
+        # 정답이 없거나 너무 짧은 조각은 바로 답할 수 없으므로 제외
+        if len(normalized) < MIN_QUESTION_LENGTH or not entry["answer"] or normalized in seen:
+            continue
+        seen.add(normalized)
+        entries.append(entry)
+
+    _index_entries(entries)
+    return entries
+
+
+# ✅ 입력 문제와 일치하는 기출문제 검색 (정확 일치 → MinHash 근사 일치 순서)
+def lookup(problem_text):
+    """일치하는 문제가 있으면 {"question", "answer", "match", "similarity"} 반환, 없으면 None"""
+    with _stats_lock:
+        STATS["lookups"] += 1
+
+    normalized = normalize_question(problem_text)
+    if len(normalized) < MIN_QUESTION_LENGTH or not QUESTION_BANK:
+        _count("misses")
+        return None
+
+    entry_id = EXACT_INDEX.get(_exact_key(normalized))
+    if entry_id is not None:
+        return dict(QUESTION_BANK[entry_id], match="exact", similarity=1.0)
+
+    # OCR 오타 등으로 정확히 일치하지 않는 경우 LSH 버킷 후보만 비교
+    signature = _minhash_signature(normalized)
+    candidates = set()
+    for key in _band_keys(signature):
+        candidates.update(LSH_BUCKETS.get(key, ()))
+
+    best_id, best_similarity = None, 0.0
+    numbers = _numbers(normalized)
+    for candidate_id in candidates:
+        # 숫자만 다른 계산 문제는 다른 문제로 취급 (예: 유동자산 500 vs 200)
+        if NUMBERS[candidate_id] != numbers:
+            continue
+        similarity = float(np.mean(SIGNATURES[candidate_id] == signature))
+        if similarity > best_similarity:
+            best_id, best_similarity = candidate_id, similarity
+
+    if best_id is not None and best_similarity >= NEAR_MATCH_THRESHOLD:
+        # 적중 여부는 해설 단계에서 확정되므로 record_fast_path / record_near_rejected에서 집계
+        return dict(QUESTION_BANK[best_id], match="near", similarity=best_similarity)
+
+    _count("misses")
+    return None
+
+
+def _numbers(normalized):
+    return sorted(re.findall(r"\d+", normalized))
+
+
+def _count(name):
+    with _stats_lock:
+        STATS[name] += 1
+
+
+def record_full_solve(seconds):
+    """문제 은행을 거치지 않은 전체 RAG 풀이 시간 기록 (절약 시간 계산용)"""
+    global _full_solve_avg
+    with _stats_lock:
+        if _full_solve_avg is None:
+            _full_solve_avg = seconds
+            # 측정 전에 있었던 문제 은행 응답도 첫 측정값 기준으로 절약 시간 반영
+            for fast_seconds in _unmeasured_fast_paths:
+                STATS["saved_seconds"] += max(_full_solve_avg - fast_seconds, 0.0)
+            _unmeasured_fast_paths.clear()
+        else:
+            _full_solve_avg = 0.8 * _full_solve_avg + 0.2 * seconds
+
+
+def record_fast_path(seconds, match):
+    """문제 은행 답변이 실제로 반환된 경우 적중 및 절약 시간 집계"""
+    with _stats_lock:
+        STATS["exact_hits" if match["match"] == "exact" else "near_hits"] += 1
+        if _full_solve_avg is None:
+            _unmeasured_fast_paths.append(seconds)
+        else:
+            STATS["saved_seconds"] += max(_full_solve_avg - seconds, 0.0)
+
+
+def record_near_rejected():
+    _count("near_rejected")
+
+
+def get_stats():
+    with _stats_lock:
+        stats = dict(STATS)
+        stats["saved_measured"] = _full_solve_avg is not None
+    hits = stats["exact_hits"] + stats["near_hits"]
+    stats["hit_rate"] = hits / stats["lookups"] if stats["lookups"] else 0.0
+    return stats
@@ -0,0 +1,366 @@
+import os
+import sys
+import json
+import secrets
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+import faiss
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from modules import index_snapshot
+
+SHARD_FAISS_FILE = "faiss_index"
+SHARD_DOCS_FILE = "docs.json"
+GLOBAL_STATS_FILE = "global_stats.json"
+
+# 샤드 하나가 이 시간 안에 응답하지 않으면 나머지 샤드 결과만으로 병합
+DEFAULT_DEADLINE = 1.0
+
+# 워커 하나가 동시에 처리하는 질의 수
+WORKER_THREADS = 4
+
+# 워커가 비정상 종료되면 다시 띄우는 최대 횟수 (샤드별)
+MAX_RESTARTS = 3
+
+# 워커가 샤드를 로드하고 READY를 보낼 때까지 기다리는 최대 시간 (초)
+STARTUP_TIMEOUT = 30.0
+
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def shard_root(version, num_shards):
+    # 워커 프로세스는 패키지 루트에서 실행되므로 절대 경로로 전달
+    return os.path.abspath(os.path.join(index_snapshot.derived_path(version), f"shards-{num_shards}"))
+
+
+# ✅ 전체 인덱스를 문서 단위로 N개 샤드로 분할해서 저장
+def build_shards(version, faiss_index, bm25_corpus, num_shards):
+    """문서 i는 샤드 i % N 에 배치 (전역 문서 번호는 그대로 유지)
+
+    BM25 점수가 샤드 간에 비교 가능하도록 전체 코퍼스 기준 idf/avgdl을 함께 저장합니다.
+    게시된 스냅샷 디렉터리는 건드리지 않고 버전별 파생 데이터 디렉터리에 쓰며,
+    임시 디렉터리에 쓴 뒤 rename 합니다.
+    """
+    root = shard_root(version, num_shards)
+    if os.path.exists(root):
+        return root
+
+    os.makedirs(os.path.dirname(root), exist_ok=True)
+    num_docs = min(faiss_index.ntotal, len(bm25_corpus))
+    vectors = faiss_index.reconstruct_n(0, num_docs)
+    global_bm25 = BM25Okapi([doc.split() for doc in bm25_corpus])
+    global_stats = {"idf": global_bm25.idf, "avgdl": global_bm25.avgdl}
+
+    tmp_root = f"{root}.tmp-{secrets.token_hex(3)}"
+    for shard_id in range(num_shards):
+        doc_ids = list(range(shard_id, num_docs, num_shards))
+        shard_dir = os.path.join(tmp_root, f"shard_{shard_id}")
+        os.makedirs(shard_dir)
+
+        index = faiss.IndexFlatIP(faiss_index.d)
+        if doc_ids:
+            index.add(np.ascontiguousarray(vectors[doc_ids]))
+        faiss.write_index(index, os.path.join(shard_dir, SHARD_FAISS_FILE))
+        with open(os.path.join(shard_dir, SHARD_DOCS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": doc_ids, "texts": [bm25_corpus[i] for i in doc_ids]}, f, ensure_ascii=False)
+
+    with open(os.path.join(tmp_root, GLOBAL_STATS_FILE), "w", encoding="utf-8") as f:
+        json.dump(global_stats, f, ensure_ascii=False)
+
+    try:
+        os.rename(tmp_root, root)
+    except OSError:
+        # 다른 프로세스가 먼저 만든 경우 그쪽 결과 사용
+        if not os.path.exists(root):
+            raise
+    print(f"✅ 샤드 {num_shards}개 생성 완료: {root}")
+    return root
+
+
+class _ShardState:
+    """워커 프로세스 하나가 들고 있는 샤드 데이터"""
+
+    def __init__(self, shard_dir):
+        self.faiss_index = faiss.read_index(os.path.join(shard_dir, SHARD_FAISS_FILE))
+        with open(os.path.join(shard_dir, SHARD_DOCS_FILE), "r", encoding="utf-8") as f:
+            docs = json.load(f)
+        with open(os.path.join(os.path.dirname(shard_dir), GLOBAL_STATS_FILE), "r", encoding="utf-8") as f:
+            global_stats = json.load(f)
+
+        self.doc_ids = docs["ids"]
+        self.texts = docs["texts"]
+        self.bm25_index = None
+        if self.texts:
+            self.bm25_index = BM25Okapi([doc.split() for doc in self.texts])
+            # 샤드 로컬 통계 대신 전체 코퍼스 통계로 점수 계산 → 샤드 간 점수 일관성 유지
+            self.bm25_index.idf = global_stats["idf"]
+            self.bm25_index.avgdl = global_stats["avgdl"]
+
+    def search(self, query_embedding, query_tokens, k):
+        if self.faiss_index.ntotal == 0:
+            return []
+        distances, indices = self.faiss_index.search(query_embedding, min(k, self.faiss_index.ntotal))
+        local_ids = [int(i) for i in indices[0] if i >= 0]
+        bm25_scores = self.bm25_index.get_batch_scores(query_tokens, local_ids) if local_ids else []
+        return [
+            (self.doc_ids[i], float(dist), float(score), self.texts[i])
+            for i, dist, score in zip(local_ids, distances[0], bm25_scores)
+        ]
+
+
+def _serve_connection(conn, state, executor):
+    send_lock = threading.Lock()
+
+    def _reply(message):
+        with send_lock:
+            conn.send(message)
+
+    def _search(request_id, query_embedding, query_tokens, k):
+        try:
+            _reply((request_id, state.search(query_embedding, query_tokens, k)))
+        except (EOFError, OSError):
+            pass
+
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "search":
+                # 질의마다 스레드 풀에서 처리 → 느린 질의가 뒤 질의를 막지 않음
+                executor.submit(_search, *message[1:])
+            elif message[0] == "ping":
+                _reply((message[1], "pong"))
+            elif message[0] == "stop":
+                os._exit(0)
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+
+def _exit_when_parent_gone():
+    # 부모 프로세스가 종료되면 stdin 파이프가 닫힘 → 워커도 함께 종료
+    sys.stdin.read()
+    os._exit(0)
+
+
+def run_worker(shard_dir, host="127.0.0.1", port=0):
+    """샤드 워커 메인 루프 (python -m modules.shard_search <shard_dir>)"""
+    threading.Thread(target=_exit_when_parent_gone, daemon=True).start()
+
+    authkey = bytes.fromhex(os.environ["RAG_SHARD_AUTHKEY"])
+    state = _ShardState(shard_dir)
+    listener = Listener((host, port), authkey=authkey)
+    executor = ThreadPoolExecutor(max_workers=WORKER_THREADS)
+
+    # 부모 프로세스에 접속 주소 전달
+    print(f"READY {listener.address[0]} {listener.address[1]}", flush=True)
+
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=_serve_connection, args=(conn, state, executor), daemon=True).start()
+
+
+class ShardPool:
+    """로컬 샤드 워커 프로세스 묶음 + scatter-gather 검색
+
+    샤드마다 수신 스레드가 하나씩 있어 응답을 request_id로 해당 질의에 전달합니다.
+    락은 request_id 발급과 전송 순간에만 잡으므로 여러 질의가 동시에 진행됩니다.
+    """
+
+    def __init__(self, root, num_shards, deadline=DEFAULT_DEADLINE):
+        self.root = root
+        self.num_shards = num_shards
+        self.deadline = deadline
+        self.processes = [None] * num_shards
+        self.connections = [None] * num_shards
+        self.dead_shards = set()
+        self.restarts = [0] * num_shards
+        self.timeouts = 0
+        self._authkey = secrets.token_bytes(16)
+        self._request_id = 0
+        self._pending = {}  # request_id → {"shards": 남은 샤드 번호, "hits": [...], "done": Event}
+        self._lock = threading.Lock()
+        self._send_locks = [threading.Lock() for _ in range(num_shards)]
+        self._closed = False
+
+    def _spawn(self, shard_id):
+        env = dict(os.environ, RAG_SHARD_AUTHKEY=self._authkey.hex())
+        return subprocess.Popen(
+            [sys.executable, "-m", "modules.shard_search", os.path.join(self.root, f"shard_{shard_id}")],
+            cwd=_PACKAGE_ROOT, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+
+    def _read_ready(self, shard_id, process):
+        # readline()에는 타임아웃이 없으므로 별도 스레드에서 읽고 STARTUP_TIMEOUT까지만 대기
+        result = []
+        reader = threading.Thread(target=lambda: result.append(process.stdout.readline()), daemon=True)
+        reader.start()
+        reader.join(STARTUP_TIMEOUT)
+
+        line = result[0].split() if result else []
+        if not line or line[0] != "READY":
+            process.kill()  # stdout이 닫히면서 reader 스레드도 종료됨
+            reason = "응답 없음" if reader.is_alive() else "비정상 종료"
+            raise RuntimeError(f"❌ 샤드 {shard_id} 워커를 시작하지 못했습니다. ({reason})")
+        return line
+
+    def _connect(self, shard_id, process):
+        line = self._read_ready(shard_id, process)
+        conn = Client((line[1], int(line[2])), authkey=self._authkey)
+        with self._lock:
+            self.processes[shard_id] = process
+            self.connections[shard_id] = conn
+            self.dead_shards.discard(shard_id)
+        threading.Thread(target=self._receive, args=(shard_id, conn), daemon=True).start()
+
+    def start(self):
+        processes = [self._spawn(shard_id) for shard_id in range(self.num_shards)]
+        try:
+            for shard_id, process in enumerate(processes):
+                self._connect(shard_id, process)
+        except Exception:
+            for process in processes:
+                process.kill()
+            self.close()
+            raise
+
+        print(f"✅ 샤드 워커 {self.num_shards}개 실행 중")
+        return self
+
+    def _receive(self, shard_id, conn):
+        while True:
+            try:
+                reply_id, shard_hits = conn.recv()
+            except (EOFError, OSError):
+                self._on_shard_lost(shard_id, conn)
+                return
+            with self._lock:
+                request = self._pending.get(reply_id)
+                # deadline이 지나 이미 끝난 질의의 늦은 응답은 버림
+                if request is None or shard_id not in request["shards"]:
+                    continue
+                request["hits"].extend(shard_hits)
+                request["shards"].discard(shard_id)
+                if not request["shards"]:
+                    request["done"].set()
+
+    def _on_shard_lost(self, shard_id, conn):
+        with self._lock:
+            if self._closed or self.connections[shard_id] is not conn:
+                return
+            self.connections[shard_id] = None
+            self.dead_shards.add(shard_id)
+            # 이 샤드의 응답을 기다리던 질의는 기다리지 않도록 정리
+            for request in self._pending.values():
+                request["shards"].discard(shard_id)
+                if not request["shards"]:
+                    request["done"].set()
+            can_restart = self.restarts[shard_id] < MAX_RESTARTS
+            if can_restart:
+                self.restarts[shard_id] += 1
+
+        if not can_restart:
+            print(f"❌ 샤드 {shard_id} 워커가 {MAX_RESTARTS}회 재시작 후에도 종료되었습니다. 이 샤드의 문서는 검색에서 제외됩니다.")
+            return
+        print(f"⚠️ 샤드 {shard_id} 워커 연결이 끊어졌습니다. 재시작합니다.")
+        threading.Thread(target=self._restart, args=(shard_id,), daemon=True).start()
+
+    def _restart(self, shard_id):
+        try:
+            self._connect(shard_id, self._spawn(shard_id))
+            print(f"✅ 샤드 {shard_id} 워커 재시작 완료")
+        except Exception as e:
+            print(f"❌ 샤드 {shard_id} 워커 재시작 실패: {e} 이 샤드의 문서는 검색에서 제외됩니다.")
+
+    def search(self, query_embedding, query_tokens, k):
+        """모든 샤드에 질의를 보내고 deadline 안에 도착한 결과를 병합
+
+        반환: (전역 문서 번호, 내적 점수, BM25 점수, 텍스트) 리스트, 내적 점수 내림차순 상위 k개
+        """
+        with self._lock:
+            self._request_id += 1
+            request_id = self._request_id
+            targets = [(i, conn) for i, conn in enumerate(self.connections) if conn is not None]
+            request = {"shards": {i for i, _ in targets}, "hits": [], "done": threading.Event()}
+            self._pending[request_id] = request
+            dead_shards = sorted(self.dead_shards)
+
+        if dead_shards:
+            print(f"⚠️ 중단된 샤드 {dead_shards}의 문서는 이번 검색에서 제외됩니다.")
+
+        for shard_id, conn in targets:
+            try:
+                with self._send_locks[shard_id]:
+                    conn.send(("search", request_id, query_embedding, query_tokens, k))
+            except OSError:
+                self._on_shard_lost(shard_id, conn)
+
+        if request["shards"]:
+            request["done"].wait(self.deadline)
+
+        with self._lock:
+            del self._pending[request_id]
+            slow_shards = sorted(request["shards"])
+            hits = list(request["hits"])
+            self.timeouts += len(slow_shards)
+
+        if slow_shards:
+            print(f"⚠️ 샤드 {slow_shards}가 {self.deadline}초 안에 응답하지 않아 제외했습니다.")
+
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:k]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "num_shards": self.num_shards,
+                "dead_shards": sorted(self.dead_shards),
+                "restarts": sum(self.restarts),
+                "timeouts": self.timeouts,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            connections, processes = self.connections, self.processes
+            self.connections = [None] * self.num_shards
+            self.processes = [None] * self.num_shards
+
+        for conn in connections:
+            if conn is None:
+                continue
+            try:
+                conn.send(("stop",))
+                conn.close()
+            except OSError:
+                pass
+        for process in processes:
+            if process is None:
+                continue
+            process.stdin.close()
+            try:
+                process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            process.stdout.close()
+
+
+# ✅ 스냅샷 로드 시 샤드 워커를 붙이는 함수 (index_snapshot.reload_if_changed의 prepare로 사용)
+def attach_shard_pool(snapshot, num_shards, deadline=DEFAULT_DEADLINE):
+    root = build_shards(snapshot.version, snapshot.faiss_index, snapshot.bm25_corpus, num_shards)
+    pool = ShardPool(root, num_shards, deadline).start()
+    snapshot.shard_pool = pool
+    snapshot.on_close.append(pool.close)
+
+    # 검색은 워커가 담당하므로 부모 프로세스의 전체 인덱스는 해제
+    snapshot.faiss_index = None
+    snapshot.bm25_index = None
+    return pool
+
+
+if __name__ == "__main__":
+    run_worker(sys.argv[1])
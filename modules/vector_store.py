@@ -1,12 +1,12 @@
 import os
 import faiss
 import numpy as np
-import json
 from dotenv import load_dotenv
 from openai import OpenAI
 from modules.text_processing import get_embedding
 from rank_bm25 import BM25Okapi
 from modules import vector_store
+from modules import index_snapshot
 import re
 import tiktoken
 
@@ -15,11 +15,6 @@ def normalize_text(text):
 
 encoding = tiktoken.get_encoding("cl100k_base")
 
-
-# ✅ 글로벌 변수로 벡터 인덱스 캐싱
-FAISS_INDEX = None
-BM25_CORPUS = []
-
 # ✅ 텍스트에서 숫자와 수식을 추출하는 함수 추가
 def extract_numbers_and_formula(text):
     """주어진 텍스트에서 숫자와 간단한 수식을 추출"""
@@ -44,26 +39,6 @@ os.makedirs("embeddings", exist_ok=True)
 bm25_corpus = []
 bm25_index = None
 
-# ✅ FAISS 인덱스 로드 함수
-def load_faiss_index():
-    global FAISS_INDEX
-    if not os.path.exists(FAISS_INDEX_PATH):
-        print("❌ FAISS 인덱스를 로드할 수 없습니다.")
-        return None
-    FAISS_INDEX = faiss.read_index(FAISS_INDEX_PATH)
-    return FAISS_INDEX
-
-# BM25 인덱스 로드 함수
-def load_bm25_corpus():
-    global BM25_CORPUS, bm25_index
-    if not os.path.exists(METADATA_PATH):
-        print("❌ BM25 metadata.json 파일을 찾을 수 없습니다.")
-        return []
-    with open(METADATA_PATH, "r", encoding="utf-8") as f:
-        BM25_CORPUS = json.load(f)
-    bm25_index = BM25Okapi([doc.split() for doc in BM25_CORPUS])  # ✅ 인덱스도 재생성
-    return BM25_CORPUS
-
 # ✅ FAISS + BM25 검색을 위한 인덱스 생성
 def create_faiss_index(question_answer_pairs, general_chunks):
     global bm25_corpus, bm25_index
@@ -105,40 +80,44 @@ def create_faiss_index(question_answer_pairs, general_chunks):
 
 # ✅ FAISS + BM25 검색 실행
 def search_faiss(query, top_k=7, filter_type=None):
-    global FAISS_INDEX, BM25_CORPUS
-    if FAISS_INDEX is None:
-        print("❌ 인덱스가 로드되지 않았습니다. main.py를 먼저 실행하세요.")
-        return []
-
-    query_embedding = np.array([get_embedding(query)], dtype=np.float32)
-    query_embedding /= np.linalg.norm(query_embedding)
-
-    raw_k = top_k * 4
-    distances, indices = FAISS_INDEX.search(query_embedding, raw_k)
-
-    candidate_texts = []
-    for dist, idx in zip(distances[0], indices[0]):
-        if idx < len(BM25_CORPUS):
-            similarity = 1 - dist
-            if similarity < 0.3:
-                continue
-            text = BM25_CORPUS[idx]
-            candidate_texts.append(text)
-
-        # ✅ BM25 점수로 재정렬 (normalize_text 기준으로 정렬)
-    if bm25_index is not None:
+    with index_snapshot.acquire_snapshot() as snapshot:
+        if snapshot is None:
+            print("❌ 인덱스가 로드되지 않았습니다. main.py를 먼저 실행하세요.")
+            return []
+        faiss_index, corpus, bm25 = snapshot.faiss_index, snapshot.bm25_corpus, snapshot.bm25_index
+        shard_pool = snapshot.shard_pool
+
+        query_embedding = np.array([get_embedding(query)], dtype=np.float32)
+        query_embedding /= np.linalg.norm(query_embedding)
         query_tokens = query.split()
-        scores = bm25_index.get_scores(query_tokens)
-
-        ranked = sorted(
-            candidate_texts,
-            key=lambda x: scores[BM25_CORPUS.index(x)],
-            reverse=True
-        )
-    else:
-        ranked = candidate_texts  # fallback
 
-    results = [{"type": "text", "text": t} for t in ranked[:top_k]]
+        raw_k = top_k * 4
+
+        # ✅ 샤드 모드: 모든 샤드에 scatter → 전역 상위 raw_k 병합 (BM25 점수는 샤드가 전역 통계로 계산)
+        if shard_pool is not None:
+            hits = shard_pool.search(query_embedding, query_tokens, raw_k)
+            candidates = [(text, score) for _, dist, score, text in hits if 1 - dist >= 0.3]
+            ranked = [text for text, _ in sorted(candidates, key=lambda c: c[1], reverse=True)]
+            return [{"type": "text", "text": t} for t in ranked[:top_k]]
+
+        distances, indices = faiss_index.search(query_embedding, raw_k)
+
+        candidates = []
+        for dist, idx in zip(distances[0], indices[0]):
+            if 0 <= idx < len(corpus):
+                similarity = 1 - dist
+                if similarity < 0.3:
+                    continue
+                candidates.append(idx)
+
+        # ✅ BM25 점수로 재정렬
+        if bm25 is not None:
+            scores = bm25.get_scores(query_tokens)
+            ranked = sorted(candidates, key=lambda i: scores[i], reverse=True)
+        else:
+            ranked = candidates  # fallback
+
+        results = [{"type": "text", "text": corpus[i]} for i in ranked[:top_k]]
     return results
 
 